@@ -8,18 +8,18 @@ class GeometryProcessor:
     
     @staticmethod
     def get_plane_equation(points):
-        "Calculates the plane equation from a list of 3D points."
+        "Calculates the plane equation from a list of 3D points using Newell's method, so reflex corners do not flip the normal."
         if len(points) < 3:
             raise ValueError("At least 3 points are required for the plane equation.")
-        p1, p2, p3 = points[:3]
-        v1 = np.array(p2) - np.array(p1)
-        v2 = np.array(p3) - np.array(p1)
-        normal = np.cross(v1, v2)
+        points = np.array(points, dtype=np.float64)
+        # Newell's method: area-weighted normal of the whole ring, centred for numerical stability
+        centred = points - points.mean(axis=0)
+        normal = np.cross(centred, np.roll(centred, -1, axis=0)).sum(axis=0)
         if np.linalg.norm(normal) < 1e-6:
             raise ValueError("The points are not coplanar or are collinear.")
         normal = normal / np.linalg.norm(normal)
         a, b, c = normal
-        d = np.dot(normal, p1)
+        d = np.dot(normal, points[0])
         return a, b, c, d
     
     @staticmethod
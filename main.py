@@ -4,6 +4,7 @@ from sun_direction_calculator import SunDirectionCalculator
 from shadow_analyzer import ShadowAnalyzer
 from visualizer import Visualizer
 from postgis_exporter import PostGISExporter
+from visibility_cache import VisibilityCache
 from astral import LocationInfo
 import time
 
@@ -14,6 +15,8 @@ def main():
     start_date = "2025-01-15"
     end_date = "2025-01-20"
     hour_step = 1
+    cache_file = "visibility_cache.sqlite"
+    cache_max_bytes = 2 * 1024 ** 3
     db_params = {
         "dbname": "your_db_name",
         "user": "your username",
@@ -39,8 +42,13 @@ def main():
         )
 
         if all_points_info:
-            # Perform shadow analysis
-            points_info = ShadowAnalyzer.check_all_intersections(cm, all_points_info, sun_directions, total_days)
+            # Perform shadow analysis, reusing visibility traced in earlier runs
+            cache = VisibilityCache(cache_file, max_bytes=cache_max_bytes)
+            try:
+                points_info = ShadowAnalyzer.check_all_intersections(cm, all_points_info, sun_directions, total_days, cache=cache)
+                print(f"Visibility cache: {cache.stats()}")
+            finally:
+                cache.close()
             print(f"Total runtime: {time.time() - start_time:.2f} seconds.")
             # Save and visualize results
             Visualizer.save_points_info_with_shadow(points_info, points_output_file)
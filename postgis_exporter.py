@@ -127,11 +127,19 @@ class PostGISExporter:
                     surface VARCHAR(255),
                     point GEOMETRY(POINTZ, {srid}),
                     shadow FLOAT,
+                    sky_view_factor FLOAT,
+                    irradiance FLOAT,
                     surface_type VARCHAR(100),
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """).format(srid=sql.Literal(srid))
             self.cursor.execute(query)
+            # Eski şemayla oluşturulmuş tablolara yeni sütunları ekle
+            self.cursor.execute("""
+                ALTER TABLE surface_points
+                    ADD COLUMN IF NOT EXISTS sky_view_factor FLOAT,
+                    ADD COLUMN IF NOT EXISTS irradiance FLOAT;
+            """)
             self.conn.commit()
         except Exception as e:
             self.conn.rollback()
@@ -203,11 +211,12 @@ class PostGISExporter:
                 geom_wkt = Point(coords).wkt
 
                 self.cursor.execute(sql.SQL("""
-                    INSERT INTO surface_points (bina_id, surface, point, shadow, surface_type, created_at)
-                    VALUES (%s, %s, ST_SetSRID(ST_GeomFromText(%s), {}), %s, %s, %s);
+                    INSERT INTO surface_points (bina_id, surface, point, shadow, sky_view_factor, irradiance, surface_type, created_at)
+                    VALUES (%s, %s, ST_SetSRID(ST_GeomFromText(%s), {}), %s, %s, %s, %s, %s);
                 """).format(sql.Literal(srid)), (
                     point_entry.get("bina_id"), point_entry.get("surface"), geom_wkt,
-                    point_entry.get("shadow"), surface_type, datetime.now()
+                    point_entry.get("shadow"), point_entry.get("sky_view_factor"),
+                    point_entry.get("irradiance"), surface_type, datetime.now()
                 ))
                 inserted_count += 1
 
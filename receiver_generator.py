@@ -0,0 +1,225 @@
+import logging
+import numpy as np
+import open3d as o3d
+import shapely
+from shapely.geometry import Polygon
+from shapely import contains_xy
+
+logger = logging.getLogger(__name__)
+
+class ReceiverGenerator:
+    """Generates ground-level and user-supplied receiver points for shadow analysis."""
+
+    @staticmethod
+    def get_building_footprints(cm):
+        """Collects building footprints from GroundSurface rings into a single prepared 2D geometry."""
+        vertices = np.array(cm['vertices'], dtype=np.float64)
+        footprints = []
+
+        for co in cm.get('CityObjects', {}).values():
+            if co.get('type') != 'Building':
+                continue
+            building_footprints = []
+            building_projections = []
+            for geom in co.get('geometry', []):
+                semantics = geom.get('semantics', {})
+                surfaces = semantics.get('surfaces', [])
+                values = semantics.get('values', [])
+
+                for srf_idx, boundary in enumerate(geom.get('boundaries', [])):
+                    if not boundary or len(boundary[0]) < 3:
+                        continue
+                    # Non-vertical surfaces (roofs, sloped walls) project onto the footprint with a non-zero area
+                    projection = Polygon(vertices[boundary[0]][:, :2])
+                    if not projection.is_valid:
+                        projection = projection.buffer(0)
+                    if projection.area > 1e-6:
+                        building_projections.append(projection)
+                    if not (values and srf_idx < len(values) and values[srf_idx] is not None):
+                        continue
+                    if surfaces[values[srf_idx]].get('type') != 'GroundSurface':
+                        continue
+                    shell = vertices[boundary[0]][:, :2]
+                    holes = [vertices[ring][:, :2] for ring in boundary[1:] if len(ring) >= 3]
+                    poly = Polygon(shell, holes)
+                    if not poly.is_valid:
+                        poly = poly.buffer(0)
+                    if not poly.is_empty:
+                        building_footprints.append(poly)
+
+            # Buildings without a GroundSurface fall back to the union of their projected surfaces,
+            # which keeps courtyards and inside corners open unlike a convex hull
+            if not building_footprints:
+                if building_projections:
+                    building_footprints.append(shapely.union_all(building_projections))
+                else:
+                    logger.warning("Building without a footprint is not masked out of the receiver grid.")
+            footprints.extend(building_footprints)
+
+        if not footprints:
+            return None
+        footprints = shapely.union_all(footprints)
+        shapely.prepare(footprints)
+        return footprints
+
+    @staticmethod
+    def create_relief_scene(cm):
+        """Builds an Open3D RaycastingScene from the TINRelief objects, or returns None if there are none."""
+        vertices = np.array(cm['vertices'], dtype=np.float32)
+        triangle_indices = []
+
+        for co in cm.get('CityObjects', {}).values():
+            if co.get('type') != 'TINRelief':
+                continue
+            for geom in co.get('geometry', []):
+                for boundary in geom.get('boundaries', []):
+                    for ring in boundary:
+                        for i in range(1, len(ring) - 1):
+                            triangle_indices.append([ring[0], ring[i], ring[i + 1]])
+
+        if not triangle_indices:
+            return None
+
+        triangles = vertices[np.array(triangle_indices, dtype=np.int64)].reshape(-1, 3)
+        faces = np.arange(len(triangles), dtype=np.uint32).reshape(-1, 3)
+        mesh = o3d.t.geometry.TriangleMesh(
+            vertex_positions=o3d.core.Tensor(triangles),
+            triangle_indices=o3d.core.Tensor(faces)
+        )
+        scene = o3d.t.geometry.RaycastingScene()
+        scene.add_triangles(mesh)
+        return scene
+
+    @staticmethod
+    def sample_elevations(relief_scene, xy, z_top, default_z):
+        """Drops vertical rays onto the relief; returns elevations and upward terrain normals.
+
+        Points outside the relief get default_z and a vertical normal."""
+        xy = np.asarray(xy, dtype=np.float64)
+        normals = np.zeros((len(xy), 3), dtype=np.float64)
+        normals[:, 2] = 1.0
+        if relief_scene is None or not len(xy):
+            return np.full(len(xy), default_z, dtype=np.float64), normals
+
+        rays = np.zeros((len(xy), 6), dtype=np.float32)
+        rays[:, :2] = xy
+        rays[:, 2] = z_top
+        rays[:, 5] = -1.0
+        ans = relief_scene.cast_rays(o3d.core.Tensor(rays))
+        t_hit = ans['t_hit'].numpy()
+        on_relief = np.isfinite(t_hit)
+        # Triangle winding is not guaranteed, so terrain normals are flipped to point upwards
+        relief_normals = ans['primitive_normals'].numpy()[on_relief].astype(np.float64)
+        relief_normals *= np.where(relief_normals[:, 2:] < 0, -1.0, 1.0)
+        normals[on_relief] = relief_normals
+        return np.where(on_relief, z_top - t_hit, default_z), normals
+
+    @staticmethod
+    def _z_range(cm):
+        "Returns the (min_z, max_z) of the model from the metadata extent, or from the vertices if it is missing."
+        extent = cm.get('metadata', {}).get('geographicalExtent', None)
+        if extent and len(extent) == 6:
+            return extent[2], extent[5]
+        vertices = np.array(cm.get('vertices', []), dtype=np.float64).reshape(-1, 3)
+        if not len(vertices):
+            raise ValueError("geographicalExtent is missing and the model has no vertices.")
+        return vertices[:, 2].min(), vertices[:, 2].max()
+
+    @staticmethod
+    def _grid_chunks(bounds, spacing, area, footprints, relief_scene, z_range, height_offset, chunk_size):
+        "Yields masked grid chunks of at most chunk_size points so that the full grid is never materialised."
+        min_x, min_y, max_x, max_y = bounds
+        min_z, max_z = z_range
+        x = np.arange(min_x + spacing / 2, max_x, spacing)
+        y = np.arange(min_y + spacing / 2, max_y, spacing)
+        if not len(x) or not len(y):
+            return
+
+        # Rows wider than chunk_size are split along x as well
+        cols_per_chunk = max(1, min(len(x), chunk_size))
+        rows_per_chunk = max(1, chunk_size // cols_per_chunk)
+        for row_start in range(0, len(y), rows_per_chunk):
+            for col_start in range(0, len(x), cols_per_chunk):
+                xx, yy = np.meshgrid(x[col_start:col_start + cols_per_chunk], y[row_start:row_start + rows_per_chunk])
+                xx = xx.ravel()
+                yy = yy.ravel()
+
+                keep = np.ones(len(xx), dtype=bool)
+                if area is not None:
+                    keep &= contains_xy(area, xx, yy)
+                if footprints is not None:
+                    keep[keep] = ~contains_xy(footprints, xx[keep], yy[keep])
+                if not keep.any():
+                    continue
+
+                xy = np.column_stack([xx[keep], yy[keep]])
+                z, normals = ReceiverGenerator.sample_elevations(relief_scene, xy, max_z + 1.0, min_z)
+                yield np.column_stack([xy, z + height_offset]), normals
+
+    @staticmethod
+    def generate_grid_receivers(cm, spacing=2.0, height_offset=0.1, chunk_size=100000):
+        """Yields (coordinates, normals) receiver chunks on a regular XY grid over the model extent, building footprints excluded."""
+        extent = cm.get('metadata', {}).get('geographicalExtent', None)
+        if not extent or len(extent) != 6:
+            raise ValueError("geographicalExtent is missing or invalid in the metadata.")
+
+        min_x, min_y, min_z, max_x, max_y, max_z = extent
+        footprints = ReceiverGenerator.get_building_footprints(cm)
+        relief_scene = ReceiverGenerator.create_relief_scene(cm)
+        yield from ReceiverGenerator._grid_chunks(
+            (min_x, min_y, max_x, max_y), spacing, None, footprints, relief_scene,
+            (min_z, max_z), height_offset, chunk_size
+        )
+
+    @staticmethod
+    def _as_area(polygons):
+        "Normalises a shapely geometry, a single XY ring or a list of rings/geometries into one shapely geometry."
+        if hasattr(polygons, 'geom_type'):
+            return polygons
+        try:
+            ring = np.asarray(polygons, dtype=np.float64)
+        except (TypeError, ValueError):
+            ring = None
+        if ring is not None and ring.ndim == 2 and ring.shape[1] in (2, 3):
+            return Polygon(ring[:, :2])
+        if isinstance(polygons, (list, tuple, np.ndarray)) and len(polygons):
+            return shapely.union_all([ReceiverGenerator._as_area(p) for p in polygons])
+        raise ValueError("Receiver polygons must be a shapely geometry, an (n, 2) ring or a list of them.")
+
+    @staticmethod
+    def generate_polygon_receivers(cm, polygons, spacing=2.0, height_offset=0.1, chunk_size=100000, mask_buildings=True):
+        """Yields (coordinates, normals) receiver chunks on a regular XY grid inside the given polygons (streets, squares, parks)."""
+        area = ReceiverGenerator._as_area(polygons)
+        if area.is_empty:
+            return
+        shapely.prepare(area)
+
+        min_z, max_z = ReceiverGenerator._z_range(cm)
+        footprints = ReceiverGenerator.get_building_footprints(cm) if mask_buildings else None
+        relief_scene = ReceiverGenerator.create_relief_scene(cm)
+        yield from ReceiverGenerator._grid_chunks(
+            area.bounds, spacing, area, footprints, relief_scene,
+            (min_z, max_z), height_offset, chunk_size
+        )
+
+    @staticmethod
+    def generate_point_receivers(cm, points, height_offset=0.1, chunk_size=100000):
+        """Yields (coordinates, normals) chunks from user-supplied points; (n, 2) input is draped onto the relief.
+
+        (n, 3) input is used as is with vertical normals."""
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] not in (2, 3):
+            raise ValueError("Receiver points must be an (n, 2) or (n, 3) array.")
+
+        if points.shape[1] == 3:
+            for start in range(0, len(points), chunk_size):
+                coords = points[start:start + chunk_size]
+                yield coords, np.tile([0.0, 0.0, 1.0], (len(coords), 1))
+            return
+
+        min_z, max_z = ReceiverGenerator._z_range(cm)
+        relief_scene = ReceiverGenerator.create_relief_scene(cm)
+        for start in range(0, len(points), chunk_size):
+            xy = points[start:start + chunk_size]
+            z, normals = ReceiverGenerator.sample_elevations(relief_scene, xy, max_z + 1.0, min_z)
+            yield np.column_stack([xy, z + height_offset]), normals
@@ -1,3 +1,4 @@
+from functools import lru_cache
 import numpy as np
 import open3d as o3d
 from tqdm import tqdm
@@ -41,7 +42,7 @@ class ShadowAnalyzer:
     @staticmethod
     def ray_intersects_other_surfaces(scene, source_points, directions, own_geom_id, epsilon=1e-6):
         """Open3D sahnesi ile ışın kesişim kontrolü, kendi bina geometrisini hariç tutarak."""
-        rays = np.array([np.concatenate([p, d]) for p, d in zip(source_points, directions)], dtype=np.float32)
+        rays = np.hstack([np.asarray(source_points), np.asarray(directions)]).astype(np.float32)
         rays = o3d.core.Tensor(rays)
         ans = scene.cast_rays(rays)
         t_hit = ans['t_hit'].numpy()
@@ -50,39 +51,220 @@ class ShadowAnalyzer:
         return has_hit
     
     @staticmethod
-    def process_bina_intersections(bina_id, bina_points_info, sun_directions, scene, bina_to_geom_id, total_days):
-        """Bir bina için kesişim kontrolleri ve günlük ortalama shadow hesaplama."""
+    def flatten_sun_directions(sun_directions):
+        """Gündüz doğrultularını (k, 3) dizisine toplar ve güneşin ufkun altında olduğu saat sayısını döndürür."""
+        directions = []
+        night_hours = 0
+        for day in sun_directions:
+            for hour, direction in sun_directions[day].items():
+                if direction is None:
+                    night_hours += 1
+                else:
+                    directions.append(direction)
+        directions = np.array(directions, dtype=np.float64).reshape(-1, 3)
+        return directions, night_hours
+    
+    @staticmethod
+    def trace_directions(scene, coords, directions, own_geom_id=-1, max_rays_per_batch=2000000):
+        """Tüm noktaları tüm doğrultulara karşı toplu olarak izler; (n_nokta, n_doğrultu) kesişim maskesi döndürür."""
+        coords = np.asarray(coords, dtype=np.float64)
+        directions = np.asarray(directions, dtype=np.float64)
+        n_points, n_directions = len(coords), len(directions)
+        hits = np.zeros((n_points, n_directions), dtype=bool)
+        if not n_points or not n_directions:
+            return hits
+        
+        # Her çağrıda en fazla max_rays_per_batch ışın olacak şekilde doğrultuları grupla
+        directions_per_batch = max(1, max_rays_per_batch // n_points)
+        for start in range(0, n_directions, directions_per_batch):
+            batch = directions[start:start + directions_per_batch]
+            origins = np.tile(coords, (len(batch), 1))
+            batch_directions = np.repeat(batch, n_points, axis=0)
+            has_hit = ShadowAnalyzer.ray_intersects_other_surfaces(scene, origins, batch_directions, own_geom_id)
+            hits[:, start:start + len(batch)] = has_hit.reshape(len(batch), n_points).T
+        return hits
+    
+    @staticmethod
+    def trace_directions_cached(scene, coords, directions, own_geom_id, cache, scene_hash):
+        """Önbellekte bulunan doğrultuları atlar; yalnızca eksik doğrultuları izleyip sonuçlarını önbelleğe yazar."""
+        coords = np.asarray(coords, dtype=np.float64)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        _, keys = cache.quantize_directions(directions)
+        hits = np.zeros((len(coords), len(keys)), dtype=bool)
+        if not len(coords) or not keys:
+            return hits
+        
+        points_hash = cache.hash_points(coords, own_geom_id)
+        found = cache.lookup(scene_hash, points_hash, keys, len(coords))
+        
+        # Aynı anahtara düşen doğrultular yalnızca bir kez izlenir
+        missing = {}
+        for idx, key in enumerate(keys):
+            if key not in found and key not in missing:
+                missing[key] = idx
+        if missing:
+            traced = ShadowAnalyzer.trace_directions(scene, coords, directions[list(missing.values())], own_geom_id)
+            traced_masks = {key: traced[:, col] for col, key in enumerate(missing)}
+            cache.store(scene_hash, points_hash, traced_masks, len(coords))
+            found.update(traced_masks)
+        
+        for idx, key in enumerate(keys):
+            hits[:, idx] = found[key]
+        return hits
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _hemisphere_for_orientation(normal_key, n_rays):
+        """Normal etrafında kosinüs ağırlıklı, deterministik yarıküre doğrultuları (Fibonacci spirali) üretir."""
+        normal = np.array(normal_key, dtype=np.float64)
+        normal = normal / np.linalg.norm(normal)
+        helper = np.array([1.0, 0.0, 0.0]) if abs(normal[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+        u = np.cross(normal, helper)
+        u = u / np.linalg.norm(u)
+        v = np.cross(normal, u)
+        
+        # Birim diskte eşit alanlı noktalar yarıküreye izdüşürülünce kosinüs ağırlıklı dağılım verir
+        i = np.arange(n_rays) + 0.5
+        r = np.sqrt(i / n_rays)
+        phi = i * np.pi * (3.0 - np.sqrt(5.0))
+        local = np.column_stack([r * np.cos(phi), r * np.sin(phi), np.sqrt(1.0 - r ** 2)])
+        directions = local[:, :1] * u + local[:, 1:2] * v + local[:, 2:] * normal
+        directions.setflags(write=False)
+        return directions
+    
+    @staticmethod
+    def get_hemisphere_directions(normal, n_rays=64):
+        """Aynı yönelimdeki yüzeyler arasında paylaşılan yarıküre doğrultularını döndürür."""
+        if n_rays <= 0:
+            return np.empty((0, 3))
+        normal_key = tuple(np.round(np.asarray(normal, dtype=np.float64), 3).tolist())
+        return ShadowAnalyzer._hemisphere_for_orientation(normal_key, int(n_rays))
+    
+    @staticmethod
+    def compute_sky_view_factor(scene, coords, normals, own_geom_id=-1, hemisphere_rays=64):
+        """Noktaları yönelime göre gruplar; her grup aynı yarıküre ışınlarını paylaşır ve gökyüzü görüş faktörü döndürülür."""
+        sky_view_factor = np.full(len(coords), np.nan)
+        if hemisphere_rays <= 0:
+            return sky_view_factor
+        
+        _, group_ids = np.unique(np.round(normals, 3), axis=0, return_inverse=True)
+        group_ids = group_ids.ravel()
+        for group in np.unique(group_ids):
+            idx = np.flatnonzero(group_ids == group)
+            hemisphere = ShadowAnalyzer.get_hemisphere_directions(normals[idx[0]], hemisphere_rays)
+            # Ufkun altındaki yarıküre ışınları zemine çarpar; izlenmeden kapalı sayılır
+            sky_rays = hemisphere[hemisphere[:, 2] > 0]
+            hits = ShadowAnalyzer.trace_directions(scene, coords[idx], sky_rays, own_geom_id)
+            sky_view_factor[idx] = (~hits).sum(axis=1) / len(hemisphere)
+        return sky_view_factor
+    
+    @staticmethod
+    def compute_point_values(scene, coords, normals, directions, night_hours, total_days, own_geom_id=-1, hemisphere_rays=64, cache=None, scene_hash=None, max_rays_per_batch=2000000):
+        """Gölge, gökyüzü görüş faktörü ve kosinüs ağırlıklı direkt ışınımı aynı çalıştırmada hesaplar."""
+        coords = np.asarray(coords, dtype=np.float64)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        normals = np.broadcast_to(np.asarray(normals, dtype=np.float64), coords.shape)
+        normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+        
+        if cache is None:
+            sky_view_factor = ShadowAnalyzer.compute_sky_view_factor(scene, coords, normals, own_geom_id, hemisphere_rays)
+        else:
+            sky_view_factor = np.full(len(coords), np.nan)
+            if hemisphere_rays > 0:
+                # Gökyüzü görüş faktörü tarihten bağımsız, normallere bağlıdır; anahtar normalleri de içerir
+                points_hash = cache.hash_points(coords, own_geom_id, normals)
+                sky_view_factor = cache.lookup_sky_view_factor(scene_hash, points_hash, hemisphere_rays, len(coords))
+                if sky_view_factor is None:
+                    sky_view_factor = ShadowAnalyzer.compute_sky_view_factor(scene, coords, normals, own_geom_id, hemisphere_rays)
+                    cache.store_sky_view_factor(scene_hash, points_hash, hemisphere_rays, sky_view_factor)
+        
+        # Güneş doğrultuları bloklar halinde izlenir ve indirgenir; (n_nokta, n_doğrultu) boyutlu dizi hiç oluşturulmaz
+        shadow_hours = np.zeros(len(coords))
+        irradiance = np.zeros(len(coords))
+        directions_per_batch = max(1, max_rays_per_batch // max(1, len(coords)))
+        for start in range(0, len(directions), directions_per_batch):
+            block = directions[start:start + directions_per_batch]
+            if cache is not None:
+                hits = ShadowAnalyzer.trace_directions_cached(scene, coords, block, own_geom_id, cache, scene_hash)
+            else:
+                hits = ShadowAnalyzer.trace_directions(scene, coords, block, own_geom_id, max_rays_per_batch)
+            shadow_hours += hits.sum(axis=1)
+            irradiance += (np.clip(normals @ block.T, 0.0, None) * ~hits).sum(axis=1)
+        
+        scale = 1.0 / total_days if total_days > 0 else 0.0
+        shadow = (night_hours + shadow_hours) * scale
+        return shadow, sky_view_factor, irradiance * scale
+    
+    @staticmethod
+    def process_bina_intersections(bina_id, bina_points_info, sun_directions, scene, bina_to_geom_id, total_days, hemisphere_rays=64, cache=None, scene_hash=None):
+        """Bir bina için kesişim kontrolleri; günlük ortalama shadow, gökyüzü görüş faktörü ve direkt ışınım hesaplama."""
         own_geom_id = bina_to_geom_id.get(bina_id, -1)
+        directions, night_hours = ShadowAnalyzer.flatten_sun_directions(sun_directions)
         
-        for surface, info in bina_points_info.items():
-            points = info["points"]
-            if not points:
-                continue
-            coords = np.array([p["coordinates"] for p in points])
-            
-            for day in sun_directions:
-                for hour, direction in sun_directions[day].items():
-                    if direction is None:
-                        for point_data in points:
-                            point_data["shadow"] += 1
-                    else:
-                        directions = np.tile(direction, (len(coords), 1))
-                        has_intersections = ShadowAnalyzer.ray_intersects_other_surfaces(scene, coords, directions, own_geom_id)
-                        for point_data, has_intersection in zip(points, has_intersections):
-                            if has_intersection:
-                                point_data["shadow"] += 1
-            # Günlük ortalama shadow hesapla
-            for point_data in points:
-                point_data["shadow"] = point_data["shadow"] / total_days if total_days > 0 else 0.0
+        # Binanın tüm yüzey noktaları tek bir nokta kümesi olarak izlenir
+        points = [p for info in bina_points_info.values() for p in info["points"]]
+        if not points:
+            return bina_points_info
+        coords = np.array([p["coordinates"] for p in points])
+        normals = np.array([p["normal"] for p in points])
+        shadow, sky_view_factor, irradiance = ShadowAnalyzer.compute_point_values(
+            scene, coords, normals, directions, night_hours, total_days, own_geom_id, hemisphere_rays,
+            cache, scene_hash
+        )
+        for point_data, s, svf, irr in zip(points, shadow, sky_view_factor, irradiance):
+            point_data["shadow"] = float(s)
+            point_data["sky_view_factor"] = None if np.isnan(svf) else float(svf)
+            point_data["irradiance"] = float(irr)
         return bina_points_info
     
     @staticmethod
-    def check_all_intersections(cm, points_info, sun_directions, total_days):
-        """Tüm noktalar için kesişim kontrolü ve shadow hesaplama."""
+    def check_all_intersections(cm, points_info, sun_directions, total_days, hemisphere_rays=64, cache=None):
+        """Tüm noktalar için kesişim kontrolü; shadow, gökyüzü görüş faktörü ve direkt ışınım hesaplama."""
         scene, bina_to_geom_id = ShadowAnalyzer.create_open3d_scene(cm)
+        scene_hash = cache.hash_scene(cm) if cache is not None else None
         
         for bina_id, bina_points_info in tqdm(points_info.items(), desc="Intersection checks for all buildings"):
-            updated_points_info = ShadowAnalyzer.process_bina_intersections(bina_id, bina_points_info, sun_directions, scene, bina_to_geom_id, total_days)
+            updated_points_info = ShadowAnalyzer.process_bina_intersections(bina_id, bina_points_info, sun_directions, scene, bina_to_geom_id, total_days, hemisphere_rays, cache, scene_hash)
             points_info[bina_id] = updated_points_info
         
-        return points_info
\ No newline at end of file
+        return points_info
+    
+    @staticmethod
+    def check_receiver_intersections(cm, receivers, sun_directions, total_days, scene=None, normal=(0.0, 0.0, 1.0), hemisphere_rays=64, cache=None, scene_hash=None):
+        """Zemin ve kullanıcı alıcı noktaları için toplu hesap; parça parça gelen (n, 3) dizilerini işler.
+
+        Önbellekle birlikte dışarıdan bir sahne verilirse, o sahnedeki geometriyi tanımlayan scene_hash da verilmelidir."""
+        if scene is None:
+            scene, _ = ShadowAnalyzer.create_open3d_scene(cm)
+            if cache is not None and scene_hash is None:
+                scene_hash = cache.hash_scene(cm)
+        elif cache is not None and scene_hash is None:
+            raise ValueError("scene_hash must be given when a custom scene is used with a cache.")
+        if isinstance(receivers, (np.ndarray, tuple)):
+            receivers = [receivers]
+        directions, night_hours = ShadowAnalyzer.flatten_sun_directions(sun_directions)
+        
+        results = {"coordinates": [], "normals": [], "shadow": [], "sky_view_factor": [], "irradiance": []}
+        for chunk in tqdm(receivers, desc="Intersection checks for receivers", unit="chunk"):
+            # Parçalar (n, 3) koordinat dizisi ya da ReceiverGenerator'ın ürettiği (koordinatlar, normaller) çiftidir
+            if isinstance(chunk, tuple):
+                coords, normals = chunk
+            else:
+                coords, normals = chunk, normal
+            coords = np.asarray(coords, dtype=np.float64)
+            if not len(coords):
+                continue
+            normals = np.broadcast_to(np.asarray(normals, dtype=np.float64), coords.shape)
+            shadow, sky_view_factor, irradiance = ShadowAnalyzer.compute_point_values(
+                scene, coords, normals, directions, night_hours, total_days,
+                hemisphere_rays=hemisphere_rays, cache=cache, scene_hash=scene_hash
+            )
+            results["coordinates"].append(coords)
+            results["normals"].append(normals)
+            results["shadow"].append(shadow)
+            results["sky_view_factor"].append(sky_view_factor)
+            results["irradiance"].append(irradiance)
+        
+        if not results["coordinates"]:
+            return {"coordinates": np.empty((0, 3)), "normals": np.empty((0, 3)), "shadow": np.empty(0), "sky_view_factor": np.empty(0), "irradiance": np.empty(0)}
+        return {key: np.concatenate(values) for key, values in results.items()}
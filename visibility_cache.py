@@ -0,0 +1,215 @@
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+
+class VisibilityCache:
+    """Persistent, size-bounded LRU cache of packed ray hit masks keyed by scene, point set and sun direction."""
+
+    def __init__(self, cache_path, max_bytes=1 << 30, precision=6):
+        "Opens (or creates) the SQLite cache file; precision is the number of decimals kept per direction component."
+        self.conn = None
+        directory = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(directory, exist_ok=True)
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.mask_hits = 0
+        self.mask_misses = 0
+        self.sky_hits = 0
+        self.sky_misses = 0
+        self.rays_saved = 0
+        self.rays_traced = 0
+        self.evictions = 0
+
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS visibility (
+                scene_hash BLOB,
+                points_hash BLOB,
+                direction TEXT,
+                n_points INTEGER,
+                mask BLOB,
+                size INTEGER,
+                last_access REAL
+            );
+        """)
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS visibility_key ON visibility (scene_hash, points_hash, direction);"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS visibility_last_access ON visibility (last_access);")
+        self.conn.commit()
+        self.size_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM visibility;").fetchone()[0]
+
+    @staticmethod
+    def hash_scene(cm):
+        "Hashes the building geometry that goes into the ray-casting scene."
+        vertices = np.array(cm['vertices'], dtype=np.float32)
+        digest = hashlib.sha1()
+        for bina_id, co in cm.get('CityObjects', {}).items():
+            if co.get('type') != 'Building':
+                continue
+            digest.update(bina_id.encode('utf-8'))
+            for geom in co.get('geometry', []):
+                for boundary in geom.get('boundaries', []):
+                    for ring in boundary:
+                        digest.update(vertices[ring].tobytes())
+                        digest.update(b'|')
+        return digest.digest()
+
+    @staticmethod
+    def hash_points(coords, own_geom_id=-1, normals=None):
+        "Hashes a point set together with the geometry ID excluded from its rays and, if given, the rounded normals."
+        digest = hashlib.sha1(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+        digest.update(str(int(own_geom_id)).encode('utf-8'))
+        if normals is not None:
+            normals = np.broadcast_to(np.asarray(normals, dtype=np.float64), np.shape(coords))
+            digest.update(b'normals')
+            digest.update(np.ascontiguousarray(np.round(normals, 3) + 0.0).tobytes())
+        return digest.digest()
+
+    @staticmethod
+    def _entry_size(scene_hash, points_hash, direction, blob):
+        "Approximates the on-disk size of an entry: payload, key and a fixed per-row overhead."
+        return len(blob) + len(scene_hash) + len(points_hash) + len(direction) + 16
+
+    def quantize_directions(self, directions):
+        "Normalises and rounds directions; returns the quantized vectors and their string keys."
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        norms = np.linalg.norm(directions, axis=1, keepdims=True)
+        quantized = np.round(directions / np.where(norms > 0, norms, 1.0), self.precision)
+        quantized = quantized + 0.0  # folds -0.0 into 0.0 so both give the same key
+        keys = [",".join(f"{c:.{self.precision}f}" for c in d) for d in quantized]
+        return quantized, keys
+
+    def lookup(self, scene_hash, points_hash, keys, n_points):
+        "Returns a dict of direction key -> boolean hit mask for the keys found in the cache."
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT direction, mask FROM visibility WHERE scene_hash = ? AND points_hash = ? "
+                f"AND n_points = ? AND direction IN ({placeholders});",
+                (scene_hash, points_hash, n_points, *batch)
+            ).fetchall()
+            for direction, mask in rows:
+                found[direction] = np.unpackbits(np.frombuffer(mask, dtype=np.uint8), count=n_points).astype(bool)
+
+        self.mask_hits += len(found)
+        self.mask_misses += len(unique_keys) - len(found)
+        self.rays_saved += len(found) * n_points
+
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE visibility SET last_access = ? WHERE scene_hash = ? AND points_hash = ? AND direction = ?;",
+                [(now, scene_hash, points_hash, direction) for direction in found]
+            )
+        return found
+
+    def store(self, scene_hash, points_hash, masks, n_points):
+        "Stores a dict of direction key -> boolean hit mask as packed bits, evicting least recently used entries."
+        if not masks:
+            return
+        now = time.time()
+        rows = []
+        added = 0
+        for direction, mask in masks.items():
+            packed = np.packbits(np.asarray(mask, dtype=bool)).tobytes()
+            size = VisibilityCache._entry_size(scene_hash, points_hash, direction, packed)
+            rows.append((scene_hash, points_hash, direction, n_points, packed, size, now))
+            added += size
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO visibility (scene_hash, points_hash, direction, n_points, mask, size, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?);",
+            rows
+        )
+        self.conn.commit()
+        self.rays_traced += len(masks) * n_points
+        self.size_bytes += added
+        if self.size_bytes > self.max_bytes:
+            self.evict()
+
+    def lookup_sky_view_factor(self, scene_hash, points_hash, hemisphere_rays, n_points):
+        "Returns the cached sky-view factors of a point set, or None on a miss."
+        row = self.conn.execute(
+            "SELECT mask FROM visibility WHERE scene_hash = ? AND points_hash = ? AND direction = ? AND n_points = ?;",
+            (scene_hash, points_hash, f"sky:{hemisphere_rays}", n_points)
+        ).fetchone()
+        if row is None:
+            self.sky_misses += 1
+            return None
+
+        self.sky_hits += 1
+        self.rays_saved += hemisphere_rays * n_points
+        self.conn.execute(
+            "UPDATE visibility SET last_access = ? WHERE scene_hash = ? AND points_hash = ? AND direction = ?;",
+            (time.time(), scene_hash, points_hash, f"sky:{hemisphere_rays}")
+        )
+        return np.frombuffer(row[0], dtype=np.float32).astype(np.float64)
+
+    def store_sky_view_factor(self, scene_hash, points_hash, hemisphere_rays, sky_view_factor):
+        "Stores the sky-view factors of a point set; they do not depend on the sun and are reused across any date range."
+        values = np.asarray(sky_view_factor, dtype=np.float32).tobytes()
+        direction = f"sky:{hemisphere_rays}"
+        size = VisibilityCache._entry_size(scene_hash, points_hash, direction, values)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO visibility (scene_hash, points_hash, direction, n_points, mask, size, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?);",
+            (scene_hash, points_hash, direction, len(sky_view_factor), values, size, time.time())
+        )
+        self.conn.commit()
+        self.rays_traced += hemisphere_rays * len(sky_view_factor)
+        self.size_bytes += size
+        if self.size_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        "Deletes least recently used entries until the cache fits in max_bytes."
+        self.size_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM visibility;").fetchone()[0]
+        while self.size_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT rowid, size FROM visibility ORDER BY last_access ASC LIMIT 1000;"
+            ).fetchall()
+            if not rows:
+                break
+            to_delete = []
+            for rowid, size in rows:
+                if self.size_bytes <= self.max_bytes:
+                    break
+                to_delete.append((rowid,))
+                self.size_bytes -= size
+            self.conn.executemany("DELETE FROM visibility WHERE rowid = ?;", to_delete)
+            self.evictions += len(to_delete)
+        self.conn.commit()
+
+    def stats(self):
+        "Returns hit/miss counters for sun-direction masks and sky-view factors, and how many rays the cache saved."
+        mask_lookups = self.mask_hits + self.mask_misses
+        sky_lookups = self.sky_hits + self.sky_misses
+        return {
+            "mask_hits": self.mask_hits,
+            "mask_misses": self.mask_misses,
+            "mask_hit_rate": self.mask_hits / mask_lookups if mask_lookups else 0.0,
+            "sky_hits": self.sky_hits,
+            "sky_misses": self.sky_misses,
+            "sky_hit_rate": self.sky_hits / sky_lookups if sky_lookups else 0.0,
+            "rays_saved": self.rays_saved,
+            "rays_traced": self.rays_traced,
+            "evictions": self.evictions,
+            "size_bytes": self.size_bytes
+        }
+
+    def close(self):
+        if getattr(self, 'conn', None):
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def __del__(self):
+        self.close()
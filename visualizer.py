@@ -19,6 +19,8 @@ class Visualizer:
                             "surface": surface,
                             "point": point_data["coordinates"],
                             "shadow": point_data["shadow"],
+                            "sky_view_factor": point_data.get("sky_view_factor"),
+                            "irradiance": point_data.get("irradiance"),
                             "surface_type": info["surface_type"]
                         })
             with open(output_file, 'w') as f:
@@ -26,6 +28,14 @@ class Visualizer:
         except Exception as e:
             raise Exception(f"JSON writing error: {str(e)}")
     
+    @staticmethod
+    def save_receivers_with_shadow(receiver_results, output_file):
+        """saves array-backed receiver results (coordinates and per-point values) into a compressed .npz file"""
+        try:
+            np.savez_compressed(output_file, **receiver_results)
+        except Exception as e:
+            raise Exception(f"NPZ writing error: {str(e)}")
+    
     @staticmethod
     def get_color_for_shadow(shadow, max_shadow):
         """Determines the color based on the shadow value (0: green, max_shadow: red)."""